@@ -0,0 +1,239 @@
+import random
+import time
+import uuid
+
+from datetime import datetime, timedelta
+
+from service.utils.auth import accounts
+from service.utils.helpers import build_company_snapshot
+from service.utils.payload import build_enrichment
+
+
+first_names = ['Joel', 'Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Jamie', 'Riley', 'Avery']
+last_names = ['Weirauch', 'Smith', 'Garcia', 'Chen', 'Patel', 'Kim', 'Nguyen', 'Muller', 'Rossi', 'Silva']
+occupations = ['Software Engineer', 'Designer', 'Product Manager', 'Sales', 'Marketing', 'Support']
+cities = [('Columbus', 'OH', 39.96, -83.0), ('San Francisco', 'CA', 37.77, -122.42), ('Austin', 'TX', 30.27, -97.74)]
+
+
+def __lorem(words):
+    return ' '.join(random.choice(['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit'])
+                    for i in range(words))
+
+
+def person_payload(email, domain):
+    """
+    Build a Clearbit Person shaped response
+
+    :param email: String
+    :param domain: String
+    :return: Dictionary
+    """
+
+    given, family = random.choice(first_names), random.choice(last_names)
+    city, state, lat, lng = random.choice(cities)
+    handle = email.split('@')[0]
+
+    return {
+        'id': uuid.uuid4().hex,
+        'name': {'fullName': '%s %s' % (given, family), 'givenName': given, 'familyName': family},
+        'email': email,
+        'gender': random.choice(['male', 'female', None]),
+        'location': '%s, %s, US' % (city, state),
+        'geo': {'city': city, 'state': state, 'country': 'US', 'lat': lat, 'lng': lng},
+        'bio': __lorem(40),
+        'site': 'http://%s' % domain,
+        'avatar': 'https://d1ts43dypk8bqh.cloudfront.net/v1/avatars/%s' % uuid.uuid4().hex,
+        'employment': {'name': domain.split('.')[0].title(), 'title': random.choice(occupations), 'domain': domain},
+        'facebook': {'handle': handle},
+        'github': {'handle': handle, 'id': random.randint(1, 10 ** 7), 'avatar': None, 'company': domain,
+                   'blog': None, 'followers': random.randint(0, 5000), 'following': random.randint(0, 500)},
+        'twitter': {'handle': handle, 'id': random.randint(1, 10 ** 9), 'bio': __lorem(20),
+                    'followers': random.randint(0, 50000), 'following': random.randint(0, 2000),
+                    'statuses': random.randint(0, 90000), 'favorites': random.randint(0, 9000),
+                    'location': city, 'site': 'http://%s' % domain, 'avatar': None},
+        'linkedin': {'handle': 'pub/%s/%d' % (handle, random.randint(1, 999))},
+        'googleplus': {'handle': None},
+        'angellist': {'handle': handle, 'bio': __lorem(20), 'blog': None, 'site': None,
+                      'followers': random.randint(0, 900), 'avatar': None},
+        'aboutme': {'handle': handle, 'bio': __lorem(60), 'avatar': None},
+        'gravatar': {'handle': handle, 'urls': [{'value': 'http://%s' % domain, 'title': domain}] * 3,
+                     'avatar': None, 'avatars': [{'url': 'http://example.com/%d.png' % i, 'type': 'thumbnail'}
+                                                 for i in range(5)]},
+        'fuzzy': False,
+    }
+
+
+def company_payload(domain):
+    """
+    Build a Clearbit Company shaped response
+
+    :param domain: String
+    :return: Dictionary
+    """
+
+    name = domain.split('.')[0].title()
+    city, state, lat, lng = random.choice(cities)
+
+    return {
+        'id': uuid.uuid4().hex,
+        'name': name,
+        'legalName': '%s Inc.' % name,
+        'domain': domain,
+        'domainAliases': ['%s.net' % name.lower(), '%s.org' % name.lower()],
+        'url': 'http://%s' % domain,
+        'site': {'url': 'http://%s' % domain, 'title': name, 'h1': __lorem(5), 'metaDescription': __lorem(30),
+                 'phoneNumbers': ['+1 555-555-%04d' % random.randint(0, 9999)], 'emailAddresses': ['info@%s' % domain]},
+        'category': {'sector': 'Information Technology', 'industryGroup': 'Software & Services',
+                     'industry': 'Internet Software & Services', 'subIndustry': 'Internet Software & Services'},
+        'tags': ['Technology', 'SAAS', 'B2B', 'Enterprise'],
+        'description': __lorem(80),
+        'foundedDate': '2008-01-01',
+        'location': '%s, %s, US' % (city, state),
+        'timeZone': 'America/New_York',
+        'utcOffset': -5,
+        'geo': {'city': city, 'state': state, 'country': 'US', 'lat': lat, 'lng': lng},
+        'logo': 'https://logo.clearbit.com/%s' % domain,
+        'facebook': {'handle': name.lower()},
+        'linkedin': {'handle': 'company/%s' % name.lower()},
+        'twitter': {'handle': name.lower(), 'id': random.randint(1, 10 ** 9), 'bio': __lorem(20),
+                    'followers': random.randint(0, 10 ** 6), 'following': random.randint(0, 2000)},
+        'crunchbase': {'handle': 'organization/%s' % name.lower()},
+        'type': 'private',
+        'ticker': None,
+        'phone': None,
+        'metrics': {'raised': random.randint(0, 10 ** 8), 'employees': random.randint(1, 10000),
+                    'googleRank': random.randint(1, 10), 'alexaGlobalRank': random.randint(1, 10 ** 6),
+                    'marketCap': None, 'annualRevenue': None},
+        'tech': ['google_analytics', 'aws_route_53', 'mailchimp', 'zendesk', 'salesforce', 'segment', 'stripe'],
+    }
+
+
+def __account_profiles(account_uuids, company=False):
+    profiles = []
+    for account_uuid in account_uuids:
+        profile = {'account_uuid': account_uuid}
+
+        if company:
+            profile['tier'] = random.choice(['free', 'pro', 'enterprise'])
+        else:
+            profile['occupation'] = random.choice(occupations)
+            profile['salary'] = random.randint(40, 200) * 1000
+            profile['name'] = {'givenName': random.choice(first_names), 'familyName': random.choice(last_names)}
+
+        profiles.append(profile)
+
+    return profiles
+
+
+def __enriched(document, payload, stale):
+    last_updated = datetime.utcnow() - timedelta(days=45 if stale else 1)
+    payload['last_updated'] = last_updated
+
+    update, payload_document = build_enrichment(document['uuid'], payload)
+
+    document.update(update['$set'])
+    document['version'] = 1
+
+    return document, payload_document
+
+
+def seed(db, companies=200, people_per_company=50, accounts_per_profile=20, stale_ratio=0.05, batch_size=1000):
+    """
+    Fill a database with people and companies shaped like the ones the service saves after Clearbit enrichment.
+    Every profile has overrides for the demo accounts plus enough random accounts to reach accounts_per_profile
+
+    :param db: Database to seed, the profiles and clearbit_payloads collections are dropped first
+    :return: Dictionary of the emails and domains that were created
+    """
+
+    random.seed(42)
+
+    db.profiles.drop()
+    db.clearbit_payloads.drop()
+
+    demo_accounts = [account['uuid'] for account in accounts]
+    other_accounts = [uuid.uuid4().hex for i in range(max(accounts_per_profile, 1) * 2)]
+
+    def account_uuids():
+        extra = max(accounts_per_profile - len(demo_accounts), 0)
+        return demo_accounts[:accounts_per_profile] + random.sample(other_accounts, extra)
+
+    profiles = []
+    payloads = []
+    emails = []
+    domains = []
+
+    def flush():
+        if profiles:
+            db.profiles.insert_many(profiles)
+        if payloads:
+            db.clearbit_payloads.insert_many(payloads)
+        del profiles[:]
+        del payloads[:]
+
+    for c in range(companies):
+        domain = 'company%d.com' % c
+        company, payload = __enriched({'domain': domain, 'uuid': uuid.uuid4().hex}, company_payload(domain),
+                                      random.random() < stale_ratio)
+        # Only the second demo account overrides companies, so reads as the first demo account use the company
+        # snapshot and reads as the second one take the company lookup path
+        company_accounts = demo_accounts[1:2] + random.sample(other_accounts, max(accounts_per_profile / 4 - 1, 0))
+        company['account_profiles'] = __account_profiles(company_accounts, True)
+        profiles.append(company)
+        payloads.append(payload)
+        domains.append(domain)
+
+        snapshot = build_company_snapshot(company)
+
+        for p in range(people_per_company):
+            email = 'person%d@%s' % (p, domain)
+            person, payload = __enriched({'email': email, 'uuid': uuid.uuid4().hex}, person_payload(email, domain),
+                                         random.random() < stale_ratio)
+            person['account_profiles'] = __account_profiles(account_uuids())
+            person['company_snapshot'] = snapshot
+            profiles.append(person)
+            payloads.append(payload)
+            emails.append(email)
+
+            if len(profiles) >= batch_size:
+                flush()
+
+    flush()
+
+    return {'emails': emails, 'domains': domains}
+
+
+class FakeResource(object):
+    """
+    Stand-in for a Clearbit client resource that answers after a fixed latency
+    """
+
+    latency = 0
+    build = None
+
+    @classmethod
+    def find(cls, stream=False, **kwargs):
+        time.sleep(cls.latency)
+        return cls.build(**kwargs)
+
+
+def fake_clearbit(clearbit, latency):
+    """
+    Replace the Clearbit client resources with stand-ins that answer after the given latency
+
+    :param clearbit: The clearbit module used by the service
+    :param latency: Seconds
+    :return: void
+    """
+
+    def person(email=None):
+        return person_payload(email, email.split('@')[1])
+
+    def company(domain=None):
+        return company_payload(domain)
+
+    def person_company(email=None):
+        return {'person': person(email), 'company': company(email.split('@')[1])}
+
+    for name, build in [('Person', person), ('Company', company), ('PersonCompany', person_company)]:
+        setattr(clearbit, name, type(name, (FakeResource,), {'latency': latency, 'build': staticmethod(build)}))
@@ -0,0 +1,276 @@
+"""
+Benchmark the profile service against a seeded database with a fake Clearbit client
+
+Usage:
+    python -m benchmarks.run [--mongo memory|local] [--output results.json] [--compare previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import threading
+import time
+import urllib
+
+from base64 import b64encode
+from datetime import datetime
+
+
+def setup(args):
+    """
+    Point the service at the benchmark database before it's imported, the in-memory stand-in replaces the pymongo
+    client with mongomock
+
+    :param args: Parsed command line arguments
+    :return: void
+    """
+
+    if args.mongo == 'memory':
+        import mongomock
+        import pymongo
+
+        pymongo.MongoClient = mongomock.MongoClient
+        os.environ['MONGOLAB_URI'] = 'mongodb://localhost:27017/profile_benchmark'
+    else:
+        os.environ['MONGOLAB_URI'] = args.mongo_url
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return None
+
+    return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+def run_load(app, name, make_request, count, concurrency):
+    """
+    Send requests from a number of threads and summarize their latency
+
+    :param app: Flask app
+    :param name: Scenario name
+    :param make_request: Function taking a test client and returning a response
+    :param count: Total number of requests
+    :param concurrency: Number of threads
+    :return: Dictionary
+    """
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [count]
+
+    def worker():
+        client = app.test_client()
+
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+
+            started = time.time()
+            response = make_request(client)
+            elapsed = time.time() - started
+
+            with lock:
+                latencies.append(elapsed)
+                if not 200 <= response.status_code < 300:
+                    errors[0] += 1
+
+    started = time.time()
+    threads = [threading.Thread(target=worker) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    result = {
+        'requests': count,
+        'concurrency': concurrency,
+        'errors': errors[0],
+        'valid': errors[0] == 0,
+        'throughput': count / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+    print "%-28s %8.1f req/s  p50 %8.2fms  p99 %8.2fms  errors %d%s" % (
+        name, result['throughput'], result['p50_ms'], result['p99_ms'], result['errors'],
+        '' if result['valid'] else '  INVALID')
+
+    return result
+
+
+def run_micro(name, function, seconds):
+    """
+    Call a function repeatedly for a number of seconds
+
+    :param name: Benchmark name
+    :param function: Function taking no arguments
+    :param seconds: Float
+    :return: Dictionary
+    """
+
+    calls = 0
+    started = time.time()
+    deadline = started + seconds
+
+    while time.time() < deadline:
+        for i in range(100):
+            function()
+        calls += 100
+
+    elapsed = time.time() - started
+
+    result = {
+        'calls': calls,
+        'ops_per_sec': calls / elapsed,
+        'mean_us': elapsed / calls * 1000000,
+    }
+
+    print "%-28s %10.0f ops/s  mean %8.2fus" % (name, result['ops_per_sec'], result['mean_us'])
+
+    return result
+
+
+def compare(results, previous):
+    """
+    Print the change of every measurement from a previous run
+
+    :param results: Dictionary
+    :param previous: Dictionary
+    :return: void
+    """
+
+    print "\nChange from previous run:"
+
+    for section, key in [('endpoints', 'throughput'), ('endpoints', 'p99_ms'), ('micro', 'ops_per_sec')]:
+        for name, result in sorted(results[section].items()):
+            before = previous.get(section, {}).get(name, {}).get(key)
+            if before:
+                print "%-28s %-12s %+7.1f%%" % (name, key, (result[key] - before) / before * 100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the profile service')
+    parser.add_argument('--mongo', choices=['memory', 'local'], default='memory',
+                        help='Use the in-memory stand-in or a local MongoDB')
+    parser.add_argument('--mongo-url', default='mongodb://localhost:27017/profile_benchmark',
+                        help='MongoDB to use with --mongo local, its profiles collections are dropped')
+    parser.add_argument('--companies', type=int, default=200)
+    parser.add_argument('--people-per-company', type=int, default=50)
+    parser.add_argument('--accounts-per-profile', type=int, default=20)
+    parser.add_argument('--stale-ratio', type=float, default=0.05,
+                        help='Fraction of profiles old enough to be refreshed from Clearbit on GET')
+    parser.add_argument('--clearbit-latency', type=float, default=0.2,
+                        help='Seconds the fake Clearbit client takes to answer')
+    parser.add_argument('--eager-tasks', action='store_true',
+                        help='Run Celery tasks inline instead of dropping them')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--micro-seconds', type=float, default=2)
+    parser.add_argument('--output', help='File to write the JSON results to')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    args = parser.parse_args()
+
+    setup(args)
+
+    from service import app, celery, clearbit, model, mongo
+    from service.api import tasks
+    from service.utils import metrics
+    from service.utils.auth import accounts
+    from service.utils.helpers import merge_account_profile
+    from service.utils.query import build_query
+    from service.utils.response import json_response
+    from benchmarks.data import seed, fake_clearbit
+
+    # Metrics, rate limits and the query cache are kept in Redis which isn't part of the benchmark
+    metrics.store['redis'] = None
+    app.config['RATE_LIMITS_ENABLED'] = False
+    app.config['QUERY_CACHE_SECONDS'] = 0
+
+    fake_clearbit(clearbit, args.clearbit_latency)
+
+    if args.eager_tasks:
+        celery.conf.CELERY_ALWAYS_EAGER = True
+    else:
+        tasks.fetch_from_clearbit.delay = lambda *args, **kwargs: None
+
+    print "Seeding %d companies with %d people each..." % (args.companies, args.people_per_company)
+    started = time.time()
+    data = seed(mongo, args.companies, args.people_per_company, args.accounts_per_profile, args.stale_ratio)
+    print "Seeded in %.1f seconds\n" % (time.time() - started)
+
+    # The first demo account doesn't override any companies and the second overrides all of them
+    api_key = accounts[0]['api_key']
+    account_uuid = accounts[0]['uuid']
+    override_api_key = accounts[1]['api_key']
+    override = b64encode(json.dumps({'occupation': 'Software Engineer', 'salary': 90000}))
+    query = 'occupation=Software Engineer,salary=gte=80000'
+
+    def url(path, **params):
+        params.setdefault('API_KEY', api_key)
+        return '/profileservice/%s?%s' % (path, urllib.urlencode(params))
+
+    endpoints = {
+        'get_person': lambda client: client.get(url(random.choice(data['emails']))),
+        'get_company': lambda client: client.get(url(random.choice(data['domains']))),
+        'get_person_details': lambda client: client.get(url(random.choice(data['emails']), details=1)),
+        'get_person_company_override': lambda client: client.get(url(random.choice(data['emails']),
+                                                                     API_KEY=override_api_key)),
+        'post_existing': lambda client: client.post(url(random.choice(data['emails']))),
+        'post_new': lambda client: client.post(url('new%s@%s' % (random.getrandbits(64), random.choice(data['domains'])))),
+        'put_override': lambda client: client.put(url(random.choice(data['emails']), data=override)),
+        'query': lambda client: client.get(url('query', q=query)),
+    }
+
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'args': vars(args),
+        },
+        'endpoints': {},
+        'micro': {},
+    }
+
+    for name in sorted(endpoints):
+        results['endpoints'][name] = run_load(app, name, endpoints[name], args.requests, args.concurrency)
+
+    print
+
+    person = mongo.profiles.find_one({'email': data['emails'][0]})
+    person_without_snapshot = dict(person)
+    person_without_snapshot.pop('company_snapshot')
+    person_without_snapshot.pop('_id')  # Skips saving the snapshot so only the company lookup is measured
+    profile = model.get_profile(data['emails'][0], account_uuid)
+
+    micro = {
+        'build_query': lambda: build_query(query, account_uuid),
+        'merge_account_profile': lambda: merge_account_profile(person, account_uuid),
+        'company_from_snapshot': lambda: model.get_combined_company_profile(person, account_uuid),
+        'company_from_lookup': lambda: model.get_combined_company_profile(person_without_snapshot, account_uuid),
+        'json_response': lambda: json_response(data=profile),
+    }
+
+    for name in sorted(micro):
+        results['micro'][name] = run_micro(name, micro[name], args.micro_seconds)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+    invalid = [name for name, result in sorted(results['endpoints'].items()) if not result['valid']]
+    if invalid:
+        raise SystemExit("Requests failed in %s, their results aren't valid" % ', '.join(invalid))
+
+
+if __name__ == '__main__':
+    main()
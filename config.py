@@ -3,5 +3,36 @@ import os
 
 DEBUG = os.environ.get('DEBUG', False)
 CELERY_BROKER_URL = os.environ.get('REDISTOGO_URL', 'redis://localhost:6379/0')
+REDIS_URL = os.environ.get('REDIS_URL', CELERY_BROKER_URL)
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.5))
+REDIS_CONNECT_TIMEOUT = float(os.environ.get('REDIS_CONNECT_TIMEOUT', 0.5))
 MONGO_URL = os.environ.get('MONGOLAB_URI', 'mongodb://localhost:27017/')
-CLEARBIT_KEY = os.environ.get('CLEARBIT_KEY', '')
\ No newline at end of file
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000))
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+MONGO_PROFILE_READ_PREFERENCE = os.environ.get('MONGO_PROFILE_READ_PREFERENCE', 'secondaryPreferred')
+CONSISTENCY_WINDOW_SECONDS = float(os.environ.get('CONSISTENCY_WINDOW_SECONDS', 10))
+BROKER_POOL_LIMIT = int(os.environ.get('BROKER_POOL_LIMIT', 10))
+CLEARBIT_KEY = os.environ.get('CLEARBIT_KEY', '')
+ENRICH_CONCURRENCY = int(os.environ.get('ENRICH_CONCURRENCY', 200))
+CLEARBIT_RATE_LIMIT = float(os.environ.get('CLEARBIT_RATE_LIMIT', 10))
+
+HOT_PROFILE_FIELDS = os.environ.get(
+    'HOT_PROFILE_FIELDS',
+    'name,gender,location,geo,bio,avatar,employment,legalName,url,description,category,logo,tags,type,metrics'
+).split(',')
+COMPRESS_CLEARBIT_PAYLOADS = os.environ.get('COMPRESS_CLEARBIT_PAYLOADS', '0') != '0'
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 0))
+
+# Per API key limits for each endpoint class as (requests per second, burst, concurrent requests)
+RATE_LIMITS_ENABLED = os.environ.get('RATE_LIMITS_ENABLED', '1') != '0'
+RATE_LIMITS = {
+    'read': tuple(float(limit) for limit in os.environ.get('RATE_LIMIT_READ', '50,100,20').split(',')),
+    'write': tuple(float(limit) for limit in os.environ.get('RATE_LIMIT_WRITE', '20,50,10').split(',')),
+    'query': tuple(float(limit) for limit in os.environ.get('RATE_LIMIT_QUERY', '5,10,4').split(',')),
+}
+RATE_LIMIT_TIMEOUT_SECONDS = int(os.environ.get('RATE_LIMIT_TIMEOUT_SECONDS', 30))
+QUERY_CACHE_SECONDS = int(os.environ.get('QUERY_CACHE_SECONDS', 30))
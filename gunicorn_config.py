@@ -0,0 +1,12 @@
+import os
+
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+preload_app = True
+
+
+def post_fork(server, worker):
+    # The app may have been imported by the master process, make sure each worker creates its own clients
+    from service import reset_clients
+
+    reset_clients()
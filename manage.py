@@ -0,0 +1,29 @@
+import argparse
+import importlib
+
+
+# Command modules are only imported when they're run so starting one command doesn't pay for the others
+commands = [
+    ('enrich', 'service.commands.enrich', 'Re-enrich profiles from Clearbit'),
+    ('import', 'service.commands.import_profiles', 'Import profiles and account overrides from a CSV or NDJSON file'),
+    ('export', 'service.commands.export', 'Export the merged profiles for an account'),
+]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile service management commands')
+    subparsers = parser.add_subparsers(dest='command')
+
+    for name, module, description in commands:
+        subparsers.add_parser(name, help=description, add_help=False)
+
+    args, remaining = parser.parse_known_args()
+
+    for name, module, description in commands:
+        if name == args.command:
+            command = importlib.import_module(module)
+
+            command_parser = argparse.ArgumentParser(prog='manage.py %s' % name, description=description)
+            command.add_arguments(command_parser)
+            command_args = command_parser.parse_args(remaining)
+            command_args.func(command_args)
@@ -1,25 +1,23 @@
 import clearbit
 
 from flask import Flask
-from pymongo import MongoClient
-from pymongo.errors import InvalidName
+from pymongo import monitoring
 from celery import Celery
-from urlparse import urlparse
+from celery.signals import worker_process_init
+from redis import StrictRedis
+
+from service.utils import metrics
+from service.utils.database import LazyDatabase
 
 
 app = Flask(__name__)
 app.config.from_object('config')
 
-client = MongoClient(app.config['MONGO_URL'])
-
-mongo_uri = urlparse(app.config['MONGO_URL'])
-
-try:
-    dbname = mongo_uri.path.split('/')[1]
+# Command listeners only apply to clients created after they are registered
+monitoring.register(metrics.MongoCommandListener())
 
-    mongo = client[dbname]
-except InvalidName:
-    mongo = client.profile_collection
+# The MongoClient is created on first use in each process, see reset_clients for forked processes
+mongo = LazyDatabase(app.config)
 
 
 # Initialize Celery
@@ -28,6 +26,33 @@ celery.conf.update(app.config)
 
 clearbit.key = app.config['CLEARBIT_KEY']
 
+# Short timeouts since the rate limits, query cache and metrics call Redis on every request and let requests through
+# when it can't be reached
+redis = StrictRedis.from_url(
+    app.config['REDIS_URL'],
+    socket_timeout=app.config['REDIS_SOCKET_TIMEOUT'],
+    socket_connect_timeout=app.config['REDIS_CONNECT_TIMEOUT'],
+)
+
+metrics.init_app(app, redis)
+metrics.init_celery(redis, app.config['METRICS_FLUSH_SECONDS'])
+
+
+def reset_clients(**kwargs):
+    """
+    Drop any clients inherited from a parent process so this process creates its own.
+    Connected to Celery's worker_process_init signal and called from the gunicorn post_fork hook
+    """
+
+    mongo.reset()
+    redis.connection_pool.reset()
+
+
+worker_process_init.connect(reset_clients, weak=False)
+
+
 from service.api.views import api_endpoints
+from service.api.metrics import metrics_endpoint
 
 app.register_blueprint(api_endpoints, url_prefix='/profileservice')
+app.register_blueprint(metrics_endpoint)
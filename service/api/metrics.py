@@ -0,0 +1,22 @@
+from flask import Blueprint, Response
+
+from service.utils import metrics
+
+
+metrics_endpoint = Blueprint('metrics_endpoint', __name__)
+
+
+@metrics_endpoint.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Return the request, MongoDB, Clearbit and Celery metrics for every process in the Prometheus text format
+
+    :return: Text
+    """
+
+    body = metrics.render()
+
+    if body is None:
+        return Response(response='Metrics are unavailable\n', status=503, content_type='text/plain')
+
+    return Response(response=body, status=200, content_type='text/plain; version=0.0.4')
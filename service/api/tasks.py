@@ -1,6 +1,7 @@
 from service import celery
 
 from service.utils.clearbit import query_clearbit
+from service.utils.metrics import task_retries, task_aborts
 
 
 @celery.task
@@ -33,10 +34,13 @@ def fetch_from_clearbit(person=None, company=None, retries=0):
                     print "Queueing retry #%d for Company %s" % (retries, company.get('uuid'))
 
                 fetch_from_clearbit.apply_async([person, company, retries], countdown=60)  # Retry again in a minute (Clearbit API rate limit window)
+                task_retries.inc(task=fetch_from_clearbit.name)
             else:
                 # Toss a simple log message out that we are giving up fetching for this person/company
                 # NB: It would probably be best to monitor the frequency of this condition as it would likely indicate
                 #     that the Clearbit plan should be upgraded
+                task_aborts.inc(task=fetch_from_clearbit.name)
+
                 if person and company:
                     print "Aborting Fetch for Person %s, Company %s" % (person.get('uuid'), company.get('uuid'))
                 elif person:
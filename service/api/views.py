@@ -4,9 +4,12 @@ from flask import Blueprint, request
 from base64 import b64decode
 from bson import ObjectId
 from service.utils.auth import authenticate, get_account
-from service.utils.response import json_response
-from service.utils.helpers import is_email, days_ago, get_account_profile
+from service.utils.ratelimit import limit
+from service.utils.response import json_response, json_body_response
+from service.utils.helpers import is_email, days_ago, get_account_profile, make_consistency_token
 from service.utils.clearbit import query_clearbit
+from service.utils.cache import query_cache_key, get_cached_page, cache_page
+from service.utils.query import build_query
 from service.api.tasks import fetch_from_clearbit
 from service import model
 
@@ -15,8 +18,26 @@ api_endpoints = Blueprint('api_endpoints', __name__)
 api = api_endpoints
 
 
+def __consistency_headers(profile):
+    """
+    Return the header with the consistency token for a write, clients pass it back as the consistency_token
+    parameter so their next read sees the write
+
+    :param profile: The profile as it was after the write
+    :return: Dictionary
+    """
+
+    token = make_consistency_token(profile)
+
+    if token:
+        return {'X-Consistency-Token': token}
+
+    return None
+
+
 @api.route('/query', methods=['GET'])
 @authenticate
+@limit('query')
 def query_profiles():
     """
     Search for profiles matching a given query
@@ -29,11 +50,13 @@ def query_profiles():
     :param q: String
     :param get_before: Optional cursor and sorting direction
     :param get_after: Optional cursor and sorting direction
-    :return: JSON object
+    :param consistency_token: Optional token returned from a write that the results should include
+    :return: JSON object, the X-Cache header says if it came from the query cache (HIT, MISS or BYPASS)
     """
 
     account_uuid = get_account(request.args.get('API_KEY'))
     query = request.args.get('q')
+    token = request.args.get('consistency_token')
 
     cursor = None
     sort_order = 1
@@ -54,8 +77,27 @@ def query_profiles():
         }
 
     if query:
+        cache_key = None
+        generations = None
+        primary = False
+
+        # Reads that have to include a recent write skip the cache
+        if not token:
+            try:
+                cache_key = query_cache_key(build_query(query, account_uuid), cursor, sort_order)
+            except Exception:
+                cache_key = None  # Invalid queries are handled by run_query
+
+        if cache_key:
+            # Pages are only read from the primary for a short window after a write, a lagging secondary could
+            # otherwise have a page from before the write cached as current
+            body, generations, primary = get_cached_page(cache_key, account_uuid)
+
+            if body:
+                return json_body_response(body, headers={'X-Cache': 'HIT'})
+
         data = []
-        results = model.run_query(query, account_uuid, cursor, sort_order)
+        results = model.run_query(query, account_uuid, cursor, sort_order, token, primary)
 
         if not results:
             return json_response(status=400, message="Invalid Query")
@@ -65,12 +107,13 @@ def query_profiles():
 
             # If this is a person we need to fetch their company profile
             if not 'domain' in result:
-                company_profile = model.get_combined_company_profile(result, account_uuid)
+                company_profile = model.get_combined_company_profile(result, account_uuid, primary)
 
             # Remove the account_profiles key so we can merge in relevant data
             combined_result = result.copy()
 
             combined_result.pop('account_profiles', None)
+            combined_result.pop('company_snapshot', None)
 
             account_profile = get_account_profile(result, account_uuid)
 
@@ -82,13 +125,19 @@ def query_profiles():
                 'company': company_profile
             })
 
-        return json_response(data=data)
+        response = json_response(data=data, headers={'X-Cache': 'MISS' if generations else 'BYPASS'})
+
+        if generations:
+            cache_page(cache_key, generations, response.get_data())
+
+        return response
 
     return json_response(status=400, message="No query provided")
 
 
 @api.route('/<string:email>', methods=['POST'])
 @authenticate
+@limit('write')
 def register(email):
     """
     Register a new customer by their email address
@@ -118,24 +167,27 @@ def register(email):
             'company_uuid': result.get('company').get('uuid'),
         }
 
-        return json_response(data=response)
+        return json_response(data=response, headers=__consistency_headers(result.get('person')))
 
     return json_response(status=500, message=result)
 
 
 @api.route('/<string:profile_identifier>', methods=['GET'])
 @authenticate
+@limit('read')
 def get_profile(profile_identifier):
     """
     Return all profile information for the requested email or company
 
     :param profile_identifier: UUID, email or domain to fetch a profile for
     :param API_KEY: Required account API key
+    :param details: Optional flag to include the full Clearbit response for the person and company
+    :param consistency_token: Optional token returned from a write that the profile should include
     :return: JSON object
     """
 
     account_uuid = get_account(request.args.get('API_KEY'))
-    profile = model.get_profile(profile_identifier, account_uuid)
+    profile = model.get_profile(profile_identifier, account_uuid, request.args.get('consistency_token'))
 
     if not profile:
         return json_response(status=404, message="No Profile Found")
@@ -165,13 +217,21 @@ def get_profile(profile_identifier):
                 pass
 
     if profile_updated:
-        profile = model.get_profile(profile_identifier, account_uuid)  # Fetch the updated profile info to return
+        # Fetch the updated profile info to return, from the primary since the update won't have replicated yet
+        profile = model.get_profile(profile_identifier, account_uuid, primary=True)
+
+    # The full Clearbit response is only loaded when it is asked for
+    if request.args.get('details'):
+        for key in ['person', 'company']:
+            if profile.get(key):
+                profile[key]['clearbit'] = model.get_enrichment(profile[key])
 
     return json_response(status=200, data=profile)
 
 
 @api.route('/<string:profile_identifier>', methods=['PUT'])
 @authenticate
+@limit('write')
 def update_profile(profile_identifier):
     """
     Add or update a profile with the given information
@@ -189,7 +249,7 @@ def update_profile(profile_identifier):
         # The data should be a base64 encoded JSON string
         data = json.loads(b64decode(encoded_data))
 
-        model.update_profile(profile_identifier, data, account_uuid)
-        return json_response(message="Profile Updated")
+        profile = model.update_profile(profile_identifier, data, account_uuid)
+        return json_response(message="Profile Updated", headers=__consistency_headers(profile))
 
     return json_response(status=400, message="No data provided")
\ No newline at end of file
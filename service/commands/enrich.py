@@ -0,0 +1,271 @@
+import time
+
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from requests.exceptions import HTTPError
+
+from service import app, clearbit, model, mongo
+from service.utils.cache import invalidate_queries
+from service.utils.checkpoint import load_checkpoint, save_checkpoint
+from service.utils.clearbit import add_timestamp, is_rate_limited, lookup
+from service.utils.helpers import days_ago, get_domain
+from service.utils.payload import build_enrichment
+from service.utils.ratelimit import RateLimiter
+
+
+class Enricher(object):
+    """
+    Run Clearbit lookups for batches of profiles on a pool of threads.
+    Every thread shares one rate limiter so the pool as a whole stays under the Clearbit API limit, and company lookups
+    are coalesced by domain so a company is only fetched once no matter how many people work there.
+    """
+
+    def __init__(self, concurrency, rate, max_retries=10, max_domains=100000, stale_before=None):
+        self.pool = ThreadPool(concurrency)
+        self.limiter = RateLimiter(rate)
+        self.max_retries = max_retries
+        self.max_domains = max_domains
+        self.stale_before = stale_before
+        self.domains = OrderedDict()
+        self.lock = Lock()
+        self.lookups = 0
+        self.failures = 0
+
+    def __claim_domain(self, domain):
+        """
+        Claim the company lookup for a domain, only the first caller for a given domain gets it.
+        Only the most recently claimed domains are remembered to keep memory bounded on large runs, a company whose
+        people are spread far apart in the run may be fetched more than once
+
+        :param domain: String
+        :return: Boolean
+        """
+
+        with self.lock:
+            if domain in self.domains:
+                return False
+
+            self.domains[domain] = True
+
+            if len(self.domains) > self.max_domains:
+                self.domains.popitem(last=False)
+
+            return True
+
+    def __release_domain(self, domain):
+        """
+        Release the claim on a domain whose lookup failed so a later person at the company can retry it
+
+        :param domain: String
+        :return: void
+        """
+
+        with self.lock:
+            self.domains.pop(domain, None)
+
+    def __is_stale(self, company):
+        """
+        Check if a company fetched for one of its people is due to be looked up again
+
+        :param company: Company record
+        :return: Boolean
+        """
+
+        if self.stale_before is None:
+            return True
+
+        last_updated = company.get('last_updated')
+
+        return last_updated is None or last_updated < self.stale_before
+
+    def __lookup(self, resource, **kwargs):
+        """
+        Fetch a single record from Clearbit, waiting out the rate limit if we hit it
+
+        :param resource: clearbit.Person or clearbit.Company
+        :return: Dictionary to $set on the profile or None if the lookup failed
+        """
+
+        for attempt in range(self.max_retries):
+            self.limiter.acquire()
+
+            try:
+                result = lookup(resource, **kwargs)
+            except HTTPError as exc:
+                if is_rate_limited(exc):
+                    # Every thread backs off, not just this one (Clearbit API rate limit window)
+                    self.limiter.pause(60)
+                    continue
+                break
+            except Exception:
+                break
+
+            with self.lock:
+                self.lookups += 1
+
+            return add_timestamp(dict(result) if result else None)
+
+        with self.lock:
+            self.failures += 1
+
+        return None
+
+    def enrich(self, record):
+        """
+        Look up a person or company record and return the writes needed to save the results
+
+        :param record: Profile record
+        :return: Lists of profile requests, payload requests and the domains of the companies updated
+        """
+
+        requests = []
+        payloads = []
+        domains = []
+
+        def save(uuid, data):
+            update, payload = build_enrichment(uuid, data)
+            update['$inc'] = {'version': 1}
+            requests.append(UpdateOne({'uuid': uuid}, update))
+            if payload:
+                payloads.append(ReplaceOne({'_id': uuid}, payload, upsert=True))
+
+        if 'domain' in record:
+            domain = record.get('domain')
+            company = record
+        else:
+            domain = get_domain(record.get('email') or '')
+            company = None
+
+            data = self.__lookup(clearbit.Person, email=record.get('email'))
+            if data is not None:
+                save(record['uuid'], data)
+
+        if domain and self.__claim_domain(domain):
+            if company is None:
+                # Companies refreshed recently are left alone, they're only looked up again once they're stale
+                company = mongo.profiles.find_one({'domain': domain}, {'uuid': True, 'last_updated': True})
+                company = company if company and self.__is_stale(company) else None
+
+            data = self.__lookup(clearbit.Company, domain=domain) if company else None
+            if data is not None:
+                save(company['uuid'], data)
+                domains.append(domain)
+            elif company:
+                self.__release_domain(domain)
+
+        return requests, payloads, domains
+
+    def process(self, batch):
+        """
+        Enrich a batch of records concurrently and save the results with one bulk write per collection
+
+        :param batch: List of profile records
+        :return: void
+        """
+
+        requests = []
+        payloads = []
+        domains = []
+        for record_requests, record_payloads, record_domains in self.pool.map(self.enrich, batch):
+            requests.extend(record_requests)
+            payloads.extend(record_payloads)
+            domains.extend(record_domains)
+
+        # Payloads are written first so a profile never references a payload that doesn't exist yet
+        if payloads:
+            mongo.clearbit_payloads.bulk_write(payloads, ordered=False)
+
+        if requests:
+            mongo.profiles.bulk_write(requests, ordered=False)
+
+        if domains:
+            model.refresh_company_snapshots(domains)
+
+        # Only after the snapshots are refreshed, otherwise a query in between could cache the old snapshots as current
+        if requests:
+            invalidate_queries()
+
+
+def add_arguments(parser):
+    parser.add_argument('--all', action='store_true',
+                        help='Enrich every profile instead of only stale ones')
+    parser.add_argument('--stale-days', type=int, default=30,
+                        help='Profiles not updated in this many days are considered stale')
+    parser.add_argument('--concurrency', type=int, default=app.config['ENRICH_CONCURRENCY'],
+                        help='Number of concurrent Clearbit lookups')
+    parser.add_argument('--rate', type=float, default=app.config['CLEARBIT_RATE_LIMIT'],
+                        help='Maximum Clearbit lookups per second')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='Number of records per bulk write and checkpoint')
+    parser.add_argument('--max-domains', type=int, default=100000,
+                        help='Number of recently enriched company domains remembered to avoid fetching them again')
+    parser.add_argument('--checkpoint',
+                        help='File to save progress to and resume from')
+    parser.set_defaults(func=run)
+
+
+def run(args):
+    """
+    Re-enrich profiles from Clearbit, streaming them from MongoDB in _id order
+
+    :param args: Parsed command line arguments
+    :return: void
+    """
+
+    if args.rate <= 0:
+        raise SystemExit("Rate must be greater than 0")
+
+    state = load_checkpoint(args.checkpoint)
+    stale_before = None if args.all else days_ago(args.stale_days)
+    query = {}
+
+    if not args.all:
+        query['$or'] = [
+            {'last_updated': {'$exists': False}},
+            {'last_updated': {'$lt': stale_before}},
+        ]
+
+    if state.get('last_id'):
+        print "Resuming after %s" % state['last_id']
+        query['_id'] = {'$gt': ObjectId(state['last_id'])}
+
+    enricher = Enricher(args.concurrency, args.rate, max_domains=args.max_domains, stale_before=stale_before)
+    processed = state.get('processed', 0)
+    count = 0
+    started = time.time()
+
+    def flush(batch):
+        enricher.process(batch)
+
+        state['last_id'] = str(batch[-1]['_id'])
+        state['processed'] = processed + count
+        save_checkpoint(args.checkpoint, state)
+
+        elapsed = time.time() - started
+        print "Enriched %d records (%.1f/sec), %d Clearbit lookups, %d failures" % (
+            count, count / elapsed, enricher.lookups, enricher.failures)
+
+    cursor = mongo.profiles.find(query, {'uuid': True, 'email': True, 'domain': True}, no_cursor_timeout=True)
+    cursor = cursor.sort('_id', 1).batch_size(args.batch_size)
+
+    try:
+        batch = []
+        for record in cursor:
+            batch.append(record)
+
+            if len(batch) >= args.batch_size:
+                count += len(batch)
+                flush(batch)
+                batch = []
+
+        if batch:
+            count += len(batch)
+            flush(batch)
+    finally:
+        cursor.close()
+        enricher.pool.close()
+
+    print "Done, enriched %d records in %.1f seconds" % (count, time.time() - started)
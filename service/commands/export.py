@@ -0,0 +1,204 @@
+import gzip
+import json
+import os
+import time
+
+from multiprocessing import Pool
+from bson import ObjectId
+
+from service import mongo
+from service.utils.auth import get_account
+from service.utils.helpers import get_domain, merge_account_profile
+from service.utils.response import convert_objects
+
+
+def __split_ranges(query, count):
+    """
+    Split the _id space of the records matching a query into ranges by ObjectId timestamp
+
+    :param query: Dictionary
+    :param count: Number of ranges
+    :return: List of (lower, upper) tuples, the first lower and last upper bounds are None
+    """
+
+    first = list(mongo.profiles.find(query, {'_id': True}).sort('_id', 1).limit(1))
+    last = list(mongo.profiles.find(query, {'_id': True}).sort('_id', -1).limit(1))
+
+    if not first:
+        return []
+
+    start = first[0]['_id'].generation_time
+    step = (last[0]['_id'].generation_time - start) / count
+
+    boundaries = [None]
+    for i in range(1, count):
+        boundary = ObjectId.from_datetime(start + step * i)
+        if boundary not in boundaries:
+            boundaries.append(boundary)
+    boundaries.append(None)
+
+    return zip(boundaries[:-1], boundaries[1:])
+
+
+class CompanyCache(object):
+    """
+    Merged company profiles by domain, cleared whenever it grows past its size to keep worker memory bounded
+    """
+
+    def __init__(self, account_uuid, size=10000):
+        self.account_uuid = account_uuid
+        self.size = size
+        self.companies = {}
+
+    def load(self, domains):
+        """
+        Fetch any companies for the given domains that aren't cached yet with a single query
+
+        :param domains: Set of domains
+        :return: void
+        """
+
+        missing = [domain for domain in domains if domain not in self.companies]
+
+        if not missing:
+            return
+
+        if len(self.companies) + len(missing) > self.size:
+            self.companies = {}
+
+        for domain in missing:
+            self.companies[domain] = None
+
+        for company in mongo.profiles.find({'domain': {'$in': missing}}):
+            self.companies[company['domain']] = merge_account_profile(company, self.account_uuid)
+
+    def get(self, domain):
+        return self.companies.get(domain)
+
+
+# Company caches for the worker process by account, kept across every _id range the worker exports
+company_caches = {}
+
+
+def __get_company_cache(account_uuid):
+    """
+    Return this process's company cache for an account, creating it on first use
+
+    :param account_uuid: String
+    :return: CompanyCache
+    """
+
+    if account_uuid not in company_caches:
+        company_caches[account_uuid] = CompanyCache(account_uuid)
+
+    return company_caches[account_uuid]
+
+
+def export_range(job):
+    """
+    Export the merged profiles for one _id range to a gzipped NDJSON shard
+
+    :param job: Tuple of (query, lower, upper, account_uuid, path, batch_size)
+    :return: Tuple of (path, number of profiles written)
+    """
+
+    query, lower, upper, account_uuid, path, batch_size = job
+
+    query = query.copy()
+    id_range = {}
+    if lower:
+        id_range['$gte'] = lower
+    if upper:
+        id_range['$lt'] = upper
+    if id_range:
+        query['_id'] = id_range
+
+    companies = __get_company_cache(account_uuid)
+    count = 0
+
+    def write(out, batch):
+        companies.load(set(get_domain(person['email']) for person in batch))
+
+        for person in batch:
+            row = {
+                'person': merge_account_profile(person, account_uuid),
+                'company': companies.get(get_domain(person['email'])),
+            }
+            out.write(json.dumps(row, default=convert_objects))
+            out.write('\n')
+
+    with gzip.open(path, 'wb') as out:
+        batch = []
+
+        for person in mongo.profiles.find(query).sort('_id', 1).batch_size(batch_size):
+            batch.append(person)
+
+            if len(batch) >= batch_size:
+                write(out, batch)
+                count += len(batch)
+                batch = []
+
+        if batch:
+            write(out, batch)
+            count += len(batch)
+
+    return path, count
+
+
+def add_arguments(parser):
+    parser.add_argument('api_key',
+                        help='API key of the account to export')
+    parser.add_argument('output',
+                        help='Directory to write the export shards to')
+    parser.add_argument('--all', action='store_true',
+                        help='Export every person instead of only those with data for the account')
+    parser.add_argument('--workers', type=int, default=os.sysconf('SC_NPROCESSORS_ONLN'),
+                        help='Number of worker processes')
+    parser.add_argument('--shards-per-worker', type=int, default=4,
+                        help='Number of _id ranges to split the export into for each worker')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Number of people to fetch companies for at a time')
+    parser.set_defaults(func=run)
+
+
+def run(args):
+    """
+    Export an account's merged person and company profiles as gzipped NDJSON shards
+
+    :param args: Parsed command line arguments
+    :return: void
+    """
+
+    account_uuid = get_account(args.api_key)
+    if not account_uuid:
+        raise SystemExit("Invalid API Key")
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    query = {'email': {'$exists': True}}
+    if not args.all:
+        query['account_profiles.account_uuid'] = account_uuid
+
+    started = time.time()
+    ranges = __split_ranges(query, args.workers * args.shards_per_worker)
+
+    jobs = [
+        (query, lower, upper, account_uuid, os.path.join(args.output, '%s-%04d.ndjson.gz' % (account_uuid, index)),
+         args.batch_size)
+        for index, (lower, upper) in enumerate(ranges)
+    ]
+
+    # Each worker process creates its own MongoDB client on first use
+    pool = Pool(args.workers)
+    total = 0
+
+    try:
+        for path, count in pool.imap_unordered(export_range, jobs):
+            total += count
+            print "Wrote %d profiles to %s (%.1f/sec overall)" % (count, path, total / (time.time() - started))
+    finally:
+        pool.close()
+        pool.join()
+
+    print "Done, exported %d profiles in %d shards in %.1f seconds" % (total, len(jobs), time.time() - started)
@@ -0,0 +1,284 @@
+import csv
+import json
+import re
+import time
+import uuid
+
+from pymongo import UpdateOne
+
+from service import model, mongo
+from service.api.tasks import fetch_from_clearbit
+from service.utils.auth import get_account
+from service.utils.cache import invalidate_queries
+from service.utils.checkpoint import load_checkpoint, save_checkpoint
+from service.utils.helpers import is_email, is_domain, get_domain
+
+
+# Fields managed by the service that can't be set from an import file
+reserved_fields = [
+    '_id', 'uuid', 'email', 'domain', 'account_uuid', 'account_profiles', 'last_updated', 'version', 'company_snapshot',
+    'payload_id',
+]
+
+
+# Plain integers and decimals without leading zeros, so values like zip codes, phone numbers or the name "Nan" stay
+# strings instead of losing their zeros or turning into NaN
+number_pattern = re.compile(r'^-?(0|[1-9][0-9]*)(\.[0-9]+)?$')
+
+
+def __parse_value(value):
+    """
+    Convert a CSV value to a number if it is written as one so imported fields can be queried with gt/lt
+
+    :param value: String
+    :return: Int, float or the original string
+    """
+
+    match = number_pattern.match(value)
+
+    if not match:
+        return value
+
+    if match.group(2):
+        return float(value)
+
+    return int(value)
+
+
+def __read_csv(f):
+    """
+    Yield rows from a CSV file with a header row, empty and missing cells are dropped and numeric values are converted
+    to numbers
+
+    :param f: File object
+    :return: Generator of dictionaries
+    """
+
+    for row in csv.DictReader(f):
+        yield dict((key, __parse_value(value)) for key, value in row.items() if key and value not in ('', None))
+
+
+def __read_ndjson(f):
+    """
+    Yield rows from a newline delimited JSON file
+
+    :param f: File object
+    :return: Generator of dictionaries
+    """
+
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def __parse_row(row, account_uuid):
+    """
+    Split a row into the identifier, account and data to save
+
+    :param row: Dictionary
+    :param account_uuid: Account UUID given on the command line or None
+    :return: Tuple of (key, identifier, account_uuid, data) or None if the row has no valid identifier
+    """
+
+    # Case is kept as given since the API matches emails and domains exactly, anything other than a string (eg. a
+    # number in an NDJSON row) isn't a valid identifier
+    email = row.get('email')
+    email = email.strip() if isinstance(email, basestring) else ''
+    domain = row.get('domain')
+    domain = domain.strip() if isinstance(domain, basestring) else ''
+
+    if email and is_email(email):
+        key, identifier = 'email', email
+    elif domain and is_domain(domain):
+        key, identifier = 'domain', domain
+    else:
+        return None
+
+    data = dict((field, value) for field, value in row.items() if field not in reserved_fields)
+
+    return key, identifier, row.get('account_uuid') or account_uuid, data
+
+
+class Importer(object):
+    """
+    Save chunks of parsed rows with unordered bulk writes.
+
+    Global data is $set directly on the person or company, upserting the profile if it doesn't exist yet.  Account data
+    is merged into the account_profiles entry for the account with a positional $set, after an empty entry has been
+    pushed for any profile that doesn't have one for the account yet.
+    """
+
+    def __init__(self, enrich=False):
+        self.enrich = enrich
+        self.created = 0
+
+    def process(self, rows):
+        """
+        :param rows: List of parsed rows
+        :return: void
+        """
+
+        # Rows for the same profile are merged so each profile is only upserted once per chunk
+        profiles = {}
+        overrides = {}
+
+        for key, identifier, account_uuid, data in rows:
+            profile_data = profiles.setdefault((key, identifier), {})
+
+            if account_uuid:
+                overrides.setdefault((key, identifier, account_uuid), {}).update(data)
+            else:
+                profile_data.update(data)
+
+            if key == 'email':
+                profiles.setdefault(('domain', get_domain(identifier)), {})
+
+        new_profiles = []
+        requests = []
+
+        for (key, identifier), data in profiles.items():
+            profile = {key: identifier, 'uuid': uuid.uuid4().hex}
+            update = {'$setOnInsert': {'uuid': profile['uuid']}, '$inc': {'version': 1}}
+
+            if data:
+                update['$set'] = data
+
+            new_profiles.append(profile)
+            requests.append(UpdateOne({key: identifier}, update, upsert=True))
+
+        result = mongo.profiles.bulk_write(requests, ordered=False)
+        self.created += result.upserted_count
+
+        if overrides:
+            mongo.profiles.bulk_write([
+                UpdateOne(
+                    {key: identifier, 'account_profiles.account_uuid': {'$ne': account_uuid}},
+                    {'$push': {'account_profiles': {'account_uuid': account_uuid}}})
+                for key, identifier, account_uuid in overrides
+            ], ordered=False)
+
+            requests = [
+                UpdateOne(
+                    {key: identifier, 'account_profiles.account_uuid': account_uuid},
+                    {
+                        '$set': dict(('account_profiles.$.%s' % field, value) for field, value in data.items()),
+                        '$inc': {'version': 1},
+                    })
+                for (key, identifier, account_uuid), data in overrides.items() if data
+            ]
+
+            if requests:
+                mongo.profiles.bulk_write(requests, ordered=False)
+
+        # Keep the company snapshots on people in step with the companies this chunk changed
+        domains = [identifier for (key, identifier), data in profiles.items() if key == 'domain' and data]
+        domains.extend(identifier for key, identifier, account_uuid in overrides if key == 'domain')
+
+        if domains:
+            model.refresh_company_snapshots(set(domains))
+
+        # Only after the snapshots are refreshed, otherwise a query in between could cache the old snapshots as current
+        if result.upserted_count or any(profiles.values()):
+            invalidate_queries()
+
+        for account_uuid in set(account_uuid for key, identifier, account_uuid in overrides):
+            invalidate_queries(account_uuid)
+
+        if self.enrich and result.upserted_ids:
+            self.__queue_enrichment([new_profiles[index] for index in result.upserted_ids])
+
+    def __queue_enrichment(self, created):
+        """
+        Queue a Clearbit fetch for every profile created by a chunk, new people are fetched together with their company
+        when it was created by the same chunk
+
+        :param created: List of the person and company profiles inserted
+        :return: void
+        """
+
+        companies = dict((profile['domain'], profile) for profile in created if 'domain' in profile)
+
+        for profile in created:
+            if 'email' in profile:
+                fetch_from_clearbit.delay(profile, companies.pop(get_domain(profile['email']), None))
+
+        for company in companies.values():
+            fetch_from_clearbit.delay(company=company)
+
+
+def add_arguments(parser):
+    parser.add_argument('path',
+                        help='CSV or NDJSON file to import')
+    parser.add_argument('--format', choices=['csv', 'ndjson'],
+                        help='File format, detected from the file extension by default')
+    parser.add_argument('--api-key',
+                        help='Import the file as account overrides for this API key, rows may also set account_uuid')
+    parser.add_argument('--enrich', action='store_true',
+                        help='Queue a Clearbit fetch for every profile created by the import')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help='Number of rows per bulk write and checkpoint')
+    parser.add_argument('--checkpoint',
+                        help='File to save progress to and resume from')
+    parser.set_defaults(func=run)
+
+
+def run(args):
+    """
+    Stream profiles and account overrides from a file into MongoDB
+
+    :param args: Parsed command line arguments
+    :return: void
+    """
+
+    account_uuid = None
+    if args.api_key:
+        account_uuid = get_account(args.api_key)
+        if not account_uuid:
+            raise SystemExit("Invalid API Key")
+
+    file_format = args.format or ('csv' if args.path.lower().endswith('.csv') else 'ndjson')
+    reader = __read_csv if file_format == 'csv' else __read_ndjson
+
+    state = load_checkpoint(args.checkpoint)
+    skip = state.get('rows', 0)
+    if skip:
+        print "Resuming after row %d" % skip
+
+    importer = Importer(args.enrich)
+    count = skip
+    skipped = state.get('skipped', 0)
+    started = time.time()
+
+    def flush(chunk):
+        if chunk:
+            importer.process(chunk)
+
+        state.update({'rows': count, 'skipped': skipped})
+        save_checkpoint(args.checkpoint, state)
+
+        print "Imported %d rows (%.1f/sec), %d profiles created, %d rows skipped" % (
+            count, (count - skip) / (time.time() - started), importer.created, skipped)
+
+    with open(args.path) as f:
+        chunk = []
+
+        for index, row in enumerate(reader(f)):
+            if index < skip:
+                continue
+
+            count += 1
+            parsed = __parse_row(row, account_uuid)
+
+            if parsed:
+                chunk.append(parsed)
+            else:
+                skipped += 1
+
+            if count % args.chunk_size == 0:
+                flush(chunk)
+                chunk = []
+
+        flush(chunk)
+
+    print "Done, imported %d rows in %.1f seconds" % (count - skip, time.time() - started)
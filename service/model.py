@@ -1,9 +1,13 @@
 import uuid
 
-from service import mongo
+from service import app, mongo
 from pymongo import ReturnDocument
-from service.utils.helpers import is_email, is_domain, get_domain, get_account_profile
+from service.utils.database import read_preferences
+from service.utils.helpers import is_email, is_domain, get_domain, merge_account_profile, build_company_snapshot, \
+    parse_consistency_token
 from service.utils.query import build_query
+from service.utils.payload import build_enrichment, load_payload
+from service.utils.cache import invalidate_queries
 
 
 def __generate_uuid():
@@ -22,6 +26,42 @@ def __generate_uuid():
     raise Exception("Unable to generate unique ID")
 
 
+def __reads(primary=False):
+    """
+    Return the profiles collection to read from. Reads go to the configured read preference, usually a secondary,
+    unless they have to see the latest writes
+
+    :param primary: Boolean
+    :return: Collection
+    """
+
+    if primary:
+        return mongo.profiles
+
+    return mongo.profiles.with_options(read_preference=read_preferences[app.config['MONGO_PROFILE_READ_PREFERENCE']])
+
+
+def __is_stale(result, token):
+    """
+    Check if a profile read from a secondary is older than the write a consistency token was issued for
+
+    :param result: Result of get_profile
+    :param token: Parsed consistency token
+    :return: Boolean
+    """
+
+    uuid, version, age = token
+
+    if not result:
+        return True
+
+    for profile in result.values():
+        if profile and profile.get('uuid') == uuid and profile.get('version', 0) < version:
+            return True
+
+    return False
+
+
 def get_person_by_email(email):
     """
     Return the global person record for a given email
@@ -102,6 +142,8 @@ def create_profile(email, fname=None, lname=None, account_uuid=None):
 
         person_profile = get_person_by_email(email)
 
+        invalidate_queries()
+
         is_new = True
     else:
         company_profile = get_company_by_domain(get_domain(email))
@@ -118,13 +160,15 @@ def create_profile(email, fname=None, lname=None, account_uuid=None):
             }
         }
 
-        mongo.profiles.find_one_and_update(
+        person_profile = mongo.profiles.find_one_and_update(
             {'uuid': person_profile.get('uuid')},
-            {'$push': {'account_profiles': account_person}},
+            {'$push': {'account_profiles': account_person}, '$inc': {'version': 1}},
             upsert=True,
             return_document=ReturnDocument.AFTER
         )
 
+        invalidate_queries(account_uuid)
+
     return {
         'person': person_profile,
         'company': company_profile,
@@ -132,21 +176,47 @@ def create_profile(email, fname=None, lname=None, account_uuid=None):
     }
 
 
-def get_profile(identifier, account_uuid):
+def get_profile(identifier, account_uuid, token=None, primary=False):
     """
     Fetch a profile for the given identifier.
     If the identifier is for a company only the company profile will be returned.
-    If it is for a person a combined person and company profile will be returned
+    If it is for a person a combined person and company profile will be returned.
+    If the profile read from a secondary is older than the write the consistency token was issued for it is read again
+    from the primary
+
+    :param identifier: UUID, email or domain
+    :param account_uuid: UUID for the account requesting the profile
+    :param token: Optional consistency token returned from a write
+    :param primary: Read from the primary
+    :return: dictionary
+    """
+
+    result = __get_profile(identifier, account_uuid, primary)
+
+    token = parse_consistency_token(token)
+
+    if token and not primary and __is_stale(result, token):
+        result = __get_profile(identifier, account_uuid, True)
+
+    return result
+
+
+def __get_profile(identifier, account_uuid, primary):
+    """
+    Fetch a profile for the given identifier from a secondary or the primary
 
     :param identifier: UUID, email or domain
     :param account_uuid: UUID for the account requesting the profile
+    :param primary: Boolean
     :return: dictionary
     """
 
+    profiles = __reads(primary)
+
     if is_email(identifier):
-        profile = mongo.profiles.find_one({'email': identifier})
+        profile = profiles.find_one({'email': identifier})
     elif is_domain(identifier):
-        profile = mongo.profiles.find_one({'domain': identifier})
+        profile = profiles.find_one({'domain': identifier})
 
         result = {
             'person': None,
@@ -155,7 +225,7 @@ def get_profile(identifier, account_uuid):
 
         return result
     else:
-        profile = mongo.profiles.find_one({'uuid': identifier})
+        profile = profiles.find_one({'uuid': identifier})
 
         # Check to see if the UUID was for a company and if so return the company profile
         if profile and profile.get('domain'):
@@ -169,61 +239,115 @@ def get_profile(identifier, account_uuid):
     if not profile:
         return None
 
-    combined_person = profile.copy()
+    combined_person = merge_account_profile(profile, account_uuid)
 
-    # Get rid of all of the account_profiles so we can merge only the fields for this account
-    combined_person.pop('account_profiles', None)
+    # Fetch the company profile
+    combined_company = get_combined_company_profile(profile, account_uuid, primary)
 
-    account_profile = get_account_profile(profile, account_uuid)
+    result = {
+        'person': combined_person,
+        'company': combined_company
+    }
 
-    if account_profile:
-        combined_person.update(account_profile)
+    return result
 
-    combined_person.pop('account_uuid', None)
 
-    # Fetch the company profile
-    combined_company = get_combined_company_profile(profile, account_uuid)
-    """company_profile = mongo.profiles.find_one({'domain': get_domain(profile.get('email'))})
+def get_combined_company_profile(person_profile, account_uuid, primary=False):
+    """
+    Return the company profile for a person merged with the given account's company override.
+    The company snapshot saved on the person is used when the account doesn't override the company, otherwise the
+    company profile is fetched and a snapshot is saved on the person if it doesn't have one yet
 
-    combined_company = company_profile.copy()
+    :param person_profile: Dictionary
+    :param account_uuid: String
+    :param primary: Read the company from the primary
+    :return: Dictionary or None
+    """
 
-    # Get rid of all of the account_profiles so we can merge only the fields for this account
-    combined_company.pop('account_profiles', None)
+    snapshot = person_profile.get('company_snapshot')
 
-    account_profile = get_account_profile(company_profile, account_uuid)
+    if snapshot and account_uuid not in snapshot.get('override_accounts', []):
+        company = snapshot.copy()
+        company.pop('override_accounts', None)
 
-    if account_profile:
-        combined_company.update(account_profile)
+        return company
 
-    combined_company.pop('account_uuid', None)"""
+    company_profile = __reads(primary).find_one({'domain': get_domain(person_profile.get('email'))})
 
-    result = {
-        'person': combined_person,
-        'company': combined_company
-    }
+    if not company_profile:
+        return None
 
-    return result
+    if not snapshot and '_id' in person_profile:
+        mongo.profiles.update_one(
+            {'_id': person_profile['_id'], 'company_snapshot': {'$exists': False}},
+            {'$set': {'company_snapshot': build_company_snapshot(company_profile)}})
+
+        # The company may have been read from a lagging secondary or updated before the snapshot was saved, in which
+        # case refreshing the snapshots skipped this person, so check the company on the primary now it has one
+        latest = mongo.profiles.find_one({'_id': company_profile['_id']})
+        if latest and latest.get('version', 0) > company_profile.get('version', 0):
+            refresh_company_snapshot(latest)
+            invalidate_queries()
+
+    return merge_account_profile(company_profile, account_uuid)
+
+
+def __snapshot_content(snapshot):
+    """
+    Return the part of a company snapshot that people read, without the fields every write changes
+
+    :param snapshot: Dictionary from build_company_snapshot
+    :return: Dictionary
+    """
+
+    return dict((key, value) for key, value in snapshot.items() if key not in ['version', 'last_updated'])
 
 
-def get_combined_company_profile(person_profile, account_uuid):
-    company_profile = mongo.profiles.find_one({'domain': get_domain(person_profile.get('email'))})
+def refresh_company_snapshot(company, previous=None):
+    """
+    Update the company snapshot saved on the people who work at a company.
+    Snapshots are versioned so an older copy of the company never overwrites a newer one, and when the company as it
+    was before the write is given the people are only updated if the write changed what their snapshot shows
+
+    :param company: Company profile
+    :param previous: Optional company profile from before the write
+    :return: Boolean, whether the snapshots were updated
+    """
 
-    combined_company = company_profile.copy()
+    snapshot = build_company_snapshot(company)
 
-    # Get rid of all of the account_profiles so we can merge only the fields for this account
-    combined_company.pop('account_profiles', None)
+    # Writes that don't change the snapshot, eg. a refresh from Clearbit that returned the same data, would otherwise
+    # rewrite every person at the company
+    if previous is not None and __snapshot_content(build_company_snapshot(previous)) == __snapshot_content(snapshot):
+        return False
 
-    account_profile = get_account_profile(company_profile, account_uuid)
+    mongo.profiles.update_many(
+        {
+            'company_snapshot.domain': company.get('domain'),
+            'company_snapshot.version': {'$lt': snapshot['version']},
+        },
+        {'$set': {'company_snapshot': snapshot}})
 
-    if account_profile:
-        combined_company.update(account_profile)
+    return True
+
+
+def refresh_company_snapshots(domains):
+    """
+    Update the company snapshots for the companies with the given domains
 
-    combined_company.pop('account_uuid', None)
+    :param domains: List of domains
+    :return: void
+    """
 
-    return combined_company
+    for company in mongo.profiles.find({'domain': {'$in': list(domains)}}):
+        refresh_company_snapshot(company)
 
 
 def update_profile(identifier, data, account_uuid=None):
+    # Fields maintained by the service can't be set directly, $inc on version would also conflict with a $set of it
+    for field in ['version', 'company_snapshot', 'payload_id']:
+        data.pop(field, None)
+
     if is_email(identifier):
         # Find the person profile for this email
         profile = mongo.profiles.find_one({'email': identifier})
@@ -264,38 +388,101 @@ def update_profile(identifier, data, account_uuid=None):
         else:
             data.update({'account_uuid': account_uuid})
 
-        return mongo.profiles.find_one_and_update(
+        updated = mongo.profiles.find_one_and_update(
             {'uuid': profile.get('uuid')},
-            {'$push': {'account_profiles': existing_account_profile or data}},
+            {'$push': {'account_profiles': existing_account_profile or data}, '$inc': {'version': 1}},
             upsert=True,
             return_document=ReturnDocument.AFTER)
     elif profile and not account_uuid:
-        return mongo.profiles.find_one_and_update(
+        updated = mongo.profiles.find_one_and_update(
             {'uuid': profile.get('uuid')},
-            {'$set': data},
+            {'$set': data, '$inc': {'version': 1}},
             upsert=True,
             return_document=ReturnDocument.AFTER)
+    else:
+        # If we get here we failed to find a match for the identifier
+        return None
+
+    if updated and 'domain' in updated:
+        refresh_company_snapshot(updated, profile)
+
+    # Only after the snapshots are refreshed, otherwise a query in between could cache the old snapshots as current
+    invalidate_queries(account_uuid)
 
-    # If we get here we failed to find a match for the identifier
-    return None
+    return updated
 
 
-def run_query(query, account_uuid, cursor, sort_order=1):
+def save_enrichment(uuid, data):
     """
-    Execute a user query on the database
+    Save the data returned from Clearbit for a profile, the full response goes to the payload collection and only the
+    hot fields are saved on the profile itself
+
+    :param uuid: UUID of the profile
+    :param data: Dict of data from Clearbit including the last_updated timestamp
+    :return: Updated profile
+    """
+
+    update, payload = build_enrichment(uuid, data)
+
+    if payload:
+        mongo.clearbit_payloads.replace_one({'_id': uuid}, payload, upsert=True)
+
+    update['$inc'] = {'version': 1}
+
+    # The profile from before the write is kept so a company's people are only updated when its snapshot changed
+    previous = mongo.profiles.find_one_and_update({'uuid': uuid}, update, return_document=ReturnDocument.BEFORE)
+    updated = mongo.profiles.find_one({'uuid': uuid}) if previous else None
+
+    if updated and 'domain' in updated:
+        refresh_company_snapshot(updated, previous)
+
+    invalidate_queries()
+
+    return updated
+
+
+def get_enrichment(profile):
+    """
+    Load the full Clearbit response for a profile
+
+    :param profile: Dictionary
+    :return: Dictionary or None if there is no saved response
+    """
+
+    if not profile or not profile.get('payload_id'):
+        return None
+
+    payload = mongo.clearbit_payloads.find_one({'_id': profile.get('payload_id')})
+
+    if not payload:
+        return None
+
+    return load_payload(payload)
+
+
+def run_query(query, account_uuid, cursor, sort_order=1, token=None, primary=False):
+    """
+    Execute a user query on the database.
+    Queries run on a secondary unless the consistency token is for a write recent enough that it might not have been
+    replicated yet
 
     :param query: String
     :param account_uuid: String
     :param cursor: Dictionary or None
+    :param token: Optional consistency token returned from a write
+    :param primary: Read from the primary
     :return: MongoDB Result Cursor
     """
 
+    token = parse_consistency_token(token)
+    primary = primary or bool(token and token[2] < app.config['CONSISTENCY_WINDOW_SECONDS'])
+
     try:
         compiled_query = build_query(query, account_uuid)
 
         if cursor:
             compiled_query.update(cursor)
 
-        return mongo.profiles.find(compiled_query).sort('_id', sort_order).limit(25)
+        return __reads(primary).find(compiled_query).sort('_id', sort_order).limit(25)
     except Exception:
         return None
\ No newline at end of file
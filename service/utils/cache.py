@@ -0,0 +1,112 @@
+import hashlib
+import json
+import time
+
+from redis.exceptions import RedisError
+
+from service import app, redis
+from service.utils.response import convert_objects
+
+
+# Write generations, bumping one invalidates every cached query page it covers. Global writes (Clearbit data, new
+# profiles) can change any account's results while account overrides only change that account's
+global_generation_key = 'querycache:generation'
+account_generation_key = 'querycache:generation:%s'
+
+# When each generation was last bumped, a secondary may not have the write yet for a little while after
+global_bumped_key = 'querycache:bumped'
+account_bumped_key = 'querycache:bumped:%s'
+
+
+def query_cache_key(compiled_query, cursor, sort_order):
+    """
+    Build the cache key for a page of query results
+
+    :param compiled_query: Query from build_query, which includes the account
+    :param cursor: Dictionary or None
+    :param sort_order: Int
+    :return: String
+    """
+
+    normalized = json.dumps([compiled_query, cursor, sort_order], sort_keys=True, default=convert_objects)
+
+    return 'querycache:page:%s' % hashlib.sha1(normalized).hexdigest()
+
+
+def get_cached_page(key, account_uuid):
+    """
+    Return a cached page of query results if there have been no writes since it was cached, along with the current
+    write generations to cache a fresh page with and whether a write was made recently enough that a secondary may not
+    have it yet.  Everything is fetched with a single Redis call
+
+    :param key: Key from query_cache_key
+    :param account_uuid: String
+    :return: Tuple of (JSON response body or None, generations or None if the cache can't be used, Boolean)
+    """
+
+    if not app.config['QUERY_CACHE_SECONDS']:
+        return None, None, False
+
+    try:
+        global_generation, account_generation, global_bumped, account_bumped, cached = redis.mget(
+            global_generation_key, account_generation_key % account_uuid,
+            global_bumped_key, account_bumped_key % account_uuid, key)
+    except RedisError:
+        return None, None, False
+
+    generations = '%s:%s' % (global_generation or '0', account_generation or '0')
+
+    if cached:
+        cached_global, cached_account, body = cached.split(':', 2)
+
+        if '%s:%s' % (cached_global, cached_account) == generations:
+            return body, generations, False
+
+    bumped = max(float(global_bumped or 0), float(account_bumped or 0))
+    recent = time.time() - bumped < app.config['CONSISTENCY_WINDOW_SECONDS']
+
+    return None, generations, recent
+
+
+def cache_page(key, generations, body):
+    """
+    Cache a page of query results.
+    The generations must be the ones read before the query ran, so a write made while it was running makes the page
+    look out of date instead of letting it be served stale
+
+    :param key: Key from query_cache_key
+    :param generations: Generations returned from get_cached_page
+    :param body: JSON response body
+    :return: void
+    """
+
+    try:
+        redis.setex(key, int(app.config['QUERY_CACHE_SECONDS']), '%s:%s' % (generations, body))
+    except RedisError:
+        pass
+
+
+def invalidate_queries(account_uuid=None):
+    """
+    Invalidate the cached query pages a write may have changed
+
+    :param account_uuid: Account the write was an override for, or None for global writes which affect every account
+    :return: void
+    """
+
+    if not app.config['QUERY_CACHE_SECONDS']:
+        return
+
+    pipeline = redis.pipeline(transaction=False)
+
+    if account_uuid:
+        pipeline.incr(account_generation_key % account_uuid)
+        pipeline.set(account_bumped_key % account_uuid, time.time())
+    else:
+        pipeline.incr(global_generation_key)
+        pipeline.set(global_bumped_key, time.time())
+
+    try:
+        pipeline.execute()
+    except RedisError:
+        pass
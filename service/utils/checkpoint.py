@@ -0,0 +1,38 @@
+import json
+import os
+
+
+def load_checkpoint(path):
+    """
+    Load a previously saved checkpoint for a long running command
+
+    :param path: Path to the checkpoint file or None
+    :return: Dictionary
+    """
+
+    if not path or not os.path.exists(path):
+        return {}
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    """
+    Save the checkpoint for a long running command.
+    The file is written to a temporary path first and renamed so an interrupted write never leaves a corrupt checkpoint
+
+    :param path: Path to the checkpoint file or None
+    :param state: Dictionary of JSON serializable values
+    :return: void
+    """
+
+    if not path:
+        return
+
+    tmp_path = '%s.tmp' % path
+
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+
+    os.rename(tmp_path, path)
@@ -1,16 +1,18 @@
+import time
+
 from datetime import datetime
 from requests.exceptions import HTTPError
 
 from service import clearbit, model
+from service.utils.metrics import clearbit_duration, add_phase
 
 
-def __update_record(uuid, data):
+def add_timestamp(data):
     """
-    Add an updated timestamp to the data and save it
+    Add an updated timestamp to the data returned from Clearbit
 
-    :param uuid: UUID of the record to update
-    :param data: Dict of data to update
-    :return: Updated record
+    :param data: Dict of data or None
+    :return: Dictionary
     """
 
     last_updated = datetime.utcnow()
@@ -20,13 +22,67 @@ def __update_record(uuid, data):
     else:
         data = {'last_updated': last_updated}  # No profile data was returned from Clearbit, we need a last_updated though
 
-    return model.update_profile(uuid, data)
+    return data
+
+
+def is_rate_limited(exc):
+    """
+    Check if an HTTPError from the Clearbit client was caused by hitting the API rate limit
+
+    :param exc: HTTPError
+    :return: Boolean
+    """
+
+    response = exc.response
+
+    if response is None:
+        return False
+
+    return response.status_code == 429 or (response.status_code == 400 and 'rate_limit' in response.text)
+
+
+def lookup(resource, **kwargs):
+    """
+    Find a record with the Clearbit client, recording the latency and outcome of the call
+
+    :param resource: clearbit.Person, clearbit.Company or clearbit.PersonCompany
+    :return: Clearbit result or None
+    """
+
+    started = time.time()
+    outcome = 'error'
+
+    try:
+        result = resource.find(stream=True, **kwargs)
+        outcome = 'found' if result else 'not_found'
+
+        return result
+    except HTTPError as exc:
+        if is_rate_limited(exc):
+            outcome = 'rate_limited'
+        raise
+    finally:
+        seconds = time.time() - started
+        clearbit_duration.observe(seconds, resource=resource.__name__, outcome=outcome)
+        add_phase('clearbit', seconds)
+
+
+def __update_record(uuid, data):
+    """
+    Add an updated timestamp to the data and save it
+
+    :param uuid: UUID of the record to update
+    :param data: Dict of data to update
+    :return: Updated record
+    """
+
+    return model.save_enrichment(uuid, add_timestamp(data))
 
 
 def query_clearbit(person=None, company=None):
     try:
         if person and company:
-            result = clearbit.PersonCompany.find(email=person.get('email'), stream=True)
+            result = lookup(clearbit.PersonCompany, email=person.get('email'))
 
             person_info = []
             company_info = []
@@ -38,17 +94,17 @@ def query_clearbit(person=None, company=None):
             __update_record(person.get('uuid'), person_info)
             __update_record(company.get('uuid'), company_info)
         elif person:
-            result = clearbit.Person.find(email=person.get('email'), stream=True)
+            result = lookup(clearbit.Person, email=person.get('email'))
 
             __update_record(person.get('uuid'), result)
         elif company:
-            result = clearbit.Company.find(domain=company.get('domain'), stream=True)
+            result = lookup(clearbit.Company, domain=company.get('domain'))
 
             __update_record(company.get('uuid'), result)
 
         return True
     except HTTPError as exc:
-        if exc.response.status_code == 400 and 'rate_limit' in exc.response.message:
+        if is_rate_limited(exc):
             raise Exception('rate_limit')
         return False
     except Exception as exc:
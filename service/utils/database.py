@@ -0,0 +1,89 @@
+import os
+import threading
+
+from pymongo import MongoClient, ReadPreference
+from pymongo.errors import InvalidName
+from urlparse import urlparse
+
+
+read_preferences = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+class LazyDatabase(object):
+    """
+    Stand-in for the MongoDB database that only creates its MongoClient the first time it is used in each process.
+    MongoClient isn't fork safe, so a process forked after the client was created (gunicorn with preload_app, Celery
+    prefork or the export workers) gets a client of its own instead of sharing the parent's sockets.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.pid = None
+        self.database = None
+
+    def __create(self):
+        config = self.config
+
+        client = MongoClient(
+            config['MONGO_URL'],
+            connect=False,
+            maxPoolSize=config['MONGO_MAX_POOL_SIZE'],
+            connectTimeoutMS=config['MONGO_CONNECT_TIMEOUT_MS'],
+            socketTimeoutMS=config['MONGO_SOCKET_TIMEOUT_MS'],
+            serverSelectionTimeoutMS=config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+            readPreference=config['MONGO_READ_PREFERENCE'],
+        )
+
+        mongo_uri = urlparse(config['MONGO_URL'])
+
+        try:
+            dbname = mongo_uri.path.split('/')[1]
+
+            return client[dbname]
+        except InvalidName:
+            return client.profile_collection
+
+    def get_database(self):
+        """
+        Return the database for this process, creating the client if this process doesn't have one yet
+
+        :return: Database
+        """
+
+        pid = os.getpid()
+
+        if self.pid != pid:
+            with self.lock:
+                if self.pid != pid:
+                    # Never close a client inherited from the parent process, its sockets are still the parent's
+                    self.database = self.__create()
+                    self.pid = pid
+
+        return self.database
+
+    def reset(self):
+        """
+        Drop this process's client so the next use creates a new one, used from post-fork hooks
+
+        :return: void
+        """
+
+        with self.lock:
+            self.database = None
+            self.pid = None
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        return getattr(self.get_database(), name)
+
+    def __getitem__(self, name):
+        return self.get_database()[name]
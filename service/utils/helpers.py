@@ -1,3 +1,5 @@
+import time
+
 from datetime import datetime, timedelta
 
 
@@ -65,4 +67,79 @@ def get_account_profile(profile, account_uuid):
             if account_profile.get('account_uuid', None) == account_uuid:
                 return account_profile
 
-    return None
\ No newline at end of file
+    return None
+
+
+def merge_account_profile(profile, account_uuid):
+    """
+    Return a copy of a global profile with the account profile for the given account merged on top of it
+
+    :param profile: Dictionary
+    :param account_uuid: String
+    :return: Dictionary
+    """
+
+    combined = profile.copy()
+
+    # Get rid of all of the account_profiles so we can merge only the fields for this account
+    combined.pop('account_profiles', None)
+
+    account_profile = get_account_profile(profile, account_uuid)
+
+    if account_profile:
+        combined.update(account_profile)
+
+    combined.pop('account_uuid', None)
+    combined.pop('company_snapshot', None)
+
+    return combined
+
+
+def build_company_snapshot(company):
+    """
+    Build the copy of a company's global profile that is saved on the people who work there.
+    The snapshot lists the accounts with a company override instead of the overrides themselves so it stays small,
+    people read by one of those accounts still need the full company profile.
+
+    :param company: Company profile
+    :return: Dictionary
+    """
+
+    snapshot = dict((key, value) for key, value in company.items() if key != 'account_profiles')
+
+    snapshot['version'] = company.get('version', 0)
+    snapshot['override_accounts'] = [
+        account_profile.get('account_uuid') for account_profile in company.get('account_profiles', [])
+    ]
+
+    return snapshot
+
+
+def make_consistency_token(profile):
+    """
+    Build the token returned from a write that a client can pass back so its next read sees the write
+
+    :param profile: The profile as it was after the write
+    :return: String or None
+    """
+
+    if not profile or not profile.get('uuid'):
+        return None
+
+    return '%s:%d:%d' % (profile.get('uuid'), profile.get('version', 0), time.time() * 1000)
+
+
+def parse_consistency_token(token):
+    """
+    Parse a token built by make_consistency_token
+
+    :param token: String or None
+    :return: Tuple of (profile uuid, profile version, seconds since the write) or None if the token isn't valid
+    """
+
+    try:
+        uuid, version, written = token.split(':')
+
+        return uuid, int(version), time.time() - int(written) / 1000.0
+    except (AttributeError, ValueError):
+        return None
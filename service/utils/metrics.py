@@ -0,0 +1,251 @@
+import threading
+import time
+
+from flask import g, has_request_context, request
+from pymongo import monitoring
+from redis.exceptions import RedisError
+
+
+# Every metric defined, in the order they are rendered
+registry = []
+
+# Increments not yet sent to Redis, keyed by (metric name, sample)
+buffer = {}
+buffer_lock = threading.Lock()
+
+store = {
+    'redis': None,
+    'interval': 5,
+    'flushed': time.time(),
+}
+
+
+def _format_labels(labels):
+    """
+    Format labels the way they appear in the Prometheus text format
+
+    :param labels: Dictionary
+    :return: String
+    """
+
+    if not labels:
+        return ''
+
+    pairs = []
+    for key in sorted(labels):
+        value = str(labels[key]).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append('%s="%s"' % (key, value))
+
+    return '{%s}' % ','.join(pairs)
+
+
+def _increment(name, sample, amount):
+    with buffer_lock:
+        buffer[(name, sample)] = buffer.get((name, sample), 0) + amount
+
+
+class Counter(object):
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.type = 'counter'
+        registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        _increment(self.name, self.name + _format_labels(labels), amount)
+
+
+class Histogram(object):
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.type = 'histogram'
+        registry.append(self)
+
+    def observe(self, value, **labels):
+        for bucket in self.buckets + ('+Inf',):
+            if bucket == '+Inf' or value <= bucket:
+                bucket_labels = dict(labels, le=bucket)
+                _increment(self.name, '%s_bucket%s' % (self.name, _format_labels(bucket_labels)), 1)
+
+        _increment(self.name, '%s_sum%s' % (self.name, _format_labels(labels)), value)
+        _increment(self.name, '%s_count%s' % (self.name, _format_labels(labels)), 1)
+
+
+request_duration = Histogram('profile_request_duration_seconds', 'API request latency by endpoint')
+mongo_duration = Histogram('profile_mongo_command_duration_seconds', 'MongoDB command latency by command')
+mongo_failures = Counter('profile_mongo_command_failures_total', 'Failed MongoDB commands by command')
+clearbit_duration = Histogram('profile_clearbit_request_duration_seconds', 'Clearbit API latency by resource and outcome')
+requests_shed = Counter('profile_requests_shed_total', 'Requests rejected by the rate limits by endpoint class and reason')
+task_duration = Histogram('profile_task_duration_seconds', 'Celery task runtime by task and state')
+task_retries = Counter('profile_task_retries_total', 'Celery task retries queued by task')
+task_aborts = Counter('profile_task_aborts_total', 'Celery tasks given up on after too many retries by task')
+
+
+def add_phase(phase, seconds):
+    """
+    Add time spent in a phase (mongo, clearbit, json) to the current request for the slow request log
+
+    :param phase: String
+    :param seconds: Float
+    :return: void
+    """
+
+    if has_request_context():
+        phases = g.get('phases')
+
+        if phases is None:
+            phases = g.phases = {}
+
+        total, count = phases.get(phase, (0, 0))
+        phases[phase] = (total + seconds, count + 1)
+
+
+def flush(force=False):
+    """
+    Send the buffered increments to Redis where they are summed across every web and worker process.
+    Unless forced this only happens once every flush interval
+
+    :param force: Boolean
+    :return: void
+    """
+
+    if not store['redis'] or (not force and time.time() - store['flushed'] < store['interval']):
+        return
+
+    with buffer_lock:
+        pending = buffer.copy()
+        buffer.clear()
+        store['flushed'] = time.time()
+
+    if not pending:
+        return
+
+    pipe = store['redis'].pipeline(transaction=False)
+    for (name, sample), amount in pending.items():
+        pipe.hincrbyfloat('metrics:%s' % name, sample, amount)
+
+    try:
+        pipe.execute()
+    except Exception:
+        # Metrics should never break a request, the increments are lost
+        pass
+
+
+def render():
+    """
+    Render every metric in the Prometheus text format
+
+    :return: String or None if the metrics can't be read from Redis
+    """
+
+    if not store['redis']:
+        return None
+
+    flush(force=True)
+
+    try:
+        pipe = store['redis'].pipeline(transaction=False)
+        for metric in registry:
+            pipe.hgetall('metrics:%s' % metric.name)
+        all_samples = pipe.execute()
+    except RedisError:
+        return None
+
+    lines = []
+    for metric, samples in zip(registry, all_samples):
+        lines.append('# HELP %s %s' % (metric.name, metric.description))
+        lines.append('# TYPE %s %s' % (metric.name, metric.type))
+
+        for sample in sorted(samples):
+            lines.append('%s %s' % (sample, samples[sample]))
+
+    return '\n'.join(lines) + '\n'
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Time every MongoDB command, this has to be registered before the MongoClient is created
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1000000.0
+        mongo_duration.observe(seconds, command=event.command_name)
+        add_phase('mongo', seconds)
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1000000.0
+        mongo_duration.observe(seconds, command=event.command_name)
+        mongo_failures.inc(command=event.command_name)
+        add_phase('mongo', seconds)
+
+
+def init_app(app, redis):
+    """
+    Time every request and log slow ones with a breakdown of where the time went
+
+    :param app: Flask app
+    :param redis: Redis client used to share metrics between processes
+    :return: void
+    """
+
+    store['redis'] = redis
+    store['interval'] = app.config['METRICS_FLUSH_SECONDS']
+
+    @app.before_request
+    def start_timer():
+        g.started = time.time()
+        g.phases = {}
+
+    @app.after_request
+    def record_request(response):
+        if 'started' not in g:
+            return response
+
+        seconds = time.time() - g.started
+        request_duration.observe(seconds, endpoint=request.endpoint or 'unknown', method=request.method,
+                                 status=response.status_code)
+
+        slow_seconds = app.config['SLOW_REQUEST_SECONDS']
+        if slow_seconds and seconds >= slow_seconds:
+            phases = ', '.join('%s %.3fs in %d calls' % (phase, total, count)
+                               for phase, (total, count) in sorted(g.phases.items()))
+            app.logger.warning("Slow request %s %s %d took %.3fs (%s)", request.method, request.path,
+                               response.status_code, seconds, phases or 'no phases recorded')
+
+        flush()
+
+        return response
+
+
+def init_celery(redis, interval):
+    """
+    Time every Celery task
+
+    :param redis: Redis client used to share metrics between processes
+    :param interval: Seconds between flushes to Redis
+    :return: void
+    """
+
+    from celery.signals import task_prerun, task_postrun
+
+    store['redis'] = redis
+    store['interval'] = interval
+
+    started = {}
+
+    @task_prerun.connect(weak=False)
+    def start_timer(task_id=None, **kwargs):
+        started[task_id] = time.time()
+
+    @task_postrun.connect(weak=False)
+    def record_task(task_id=None, task=None, state=None, **kwargs):
+        if task_id in started:
+            task_duration.observe(time.time() - started.pop(task_id), task=task.name, state=state or 'unknown')
+
+        flush()
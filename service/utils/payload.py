@@ -0,0 +1,77 @@
+import json
+import zlib
+
+from bson import Binary
+
+from service import app
+from service.utils.response import convert_objects
+
+
+# Fields that identify a profile and must never be touched when saving Clearbit data
+protected_fields = [
+    '_id', 'uuid', 'email', 'domain', 'account_profiles', 'last_updated', 'payload_id', 'version', 'company_snapshot',
+]
+
+
+def build_enrichment(uuid, data):
+    """
+    Split the data returned from Clearbit into the update for the profile and the document for the payload collection.
+    Only the configured hot fields are kept on the profile, the full response is saved in the payload collection and
+    any fields left on the profile by a previous full response are removed.
+
+    :param uuid: UUID of the profile the data is for
+    :param data: Dict of data from Clearbit including the last_updated timestamp
+    :return: Tuple of (profile update, payload document or None if Clearbit had no data)
+    """
+
+    hot_fields = app.config['HOT_PROFILE_FIELDS']
+
+    hot = {'last_updated': data.get('last_updated')}
+    cold = {}
+
+    for key, value in data.items():
+        if key in protected_fields:
+            continue
+
+        if key in hot_fields:
+            hot[key] = value
+        else:
+            cold[key] = ''
+
+    update = {'$set': hot}
+
+    if cold:
+        update['$unset'] = cold
+
+    if len(data) == 1:
+        # Nothing but a last_updated timestamp
+        return update, None
+
+    hot['payload_id'] = uuid
+
+    payload = {
+        '_id': uuid,
+        'last_updated': data.get('last_updated'),
+    }
+
+    if app.config['COMPRESS_CLEARBIT_PAYLOADS']:
+        payload['compressed'] = True
+        payload['data'] = Binary(zlib.compress(json.dumps(data, default=convert_objects)))
+    else:
+        payload['data'] = data
+
+    return update, payload
+
+
+def load_payload(payload):
+    """
+    Return the Clearbit data from a payload document
+
+    :param payload: Payload document
+    :return: Dictionary
+    """
+
+    if payload.get('compressed'):
+        return json.loads(zlib.decompress(payload['data']))
+
+    return payload['data']
@@ -0,0 +1,152 @@
+import math
+import threading
+import time
+import uuid
+
+from functools import wraps
+from flask import request
+from redis.exceptions import RedisError
+
+from service import app, redis
+from service.utils.metrics import requests_shed
+from service.utils.response import json_response
+
+
+class RateLimiter(object):
+    """
+    Thread safe token bucket shared by every worker making calls against a rate limited API
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: Number of calls allowed per second
+        :param burst: Maximum number of calls that can be made at once, defaults to the rate
+        """
+
+        if rate <= 0:
+            raise ValueError("Rate must be greater than 0")
+
+        self.rate = float(rate)
+        # At least one whole token, otherwise a rate below one call a second could never hand out a call
+        self.capacity = max(1.0, float(burst or rate))
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a call can be made
+
+        :return: void
+        """
+
+        while True:
+            with self.lock:
+                now = time.time()
+
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stop handing out calls for the given number of seconds, eg. after the API reports we hit its rate limit
+
+        :param seconds: Int
+        :return: void
+        """
+
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+            self.tokens = 0
+
+
+# Admit a request if the account has a free concurrency slot and a token in its bucket for the endpoint class.
+# Returns {1} when admitted and {0, reason, seconds to wait} when not, the wait is returned as a string because Redis
+# truncates Lua numbers to integers.
+admission_script = '''
+local bucket_key, inflight_key = KEYS[1], KEYS[2]
+local rate, burst, concurrency = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local now, request_id, timeout = tonumber(ARGV[4]), ARGV[5], tonumber(ARGV[6])
+
+redis.call('ZREMRANGEBYSCORE', inflight_key, '-inf', now - timeout)
+if redis.call('ZCARD', inflight_key) >= concurrency then
+    return {0, 'concurrency', '1'}
+end
+
+local bucket = redis.call('HMGET', bucket_key, 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+
+if tokens < 1 then
+    return {0, 'rate', tostring((1 - tokens) / rate)}
+end
+
+redis.call('HMSET', bucket_key, 'tokens', tokens - 1, 'updated', now)
+redis.call('EXPIRE', bucket_key, math.ceil(burst / rate) + 1)
+redis.call('ZADD', inflight_key, now, request_id)
+redis.call('EXPIRE', inflight_key, timeout)
+
+return {1}
+'''
+
+admit = redis.register_script(admission_script)
+
+
+def limit(endpoint_class):
+    """
+    Decorator enforcing the per API key rate and concurrency limits configured for an endpoint class in RATE_LIMITS.
+    The limits are kept in Redis so they're shared by every web process, requests over a limit are rejected straight
+    away with a 429 and a Retry-After header.  If Redis can't be reached requests are let through.
+
+    :param endpoint_class: Key of RATE_LIMITS, eg. read, write or query
+    :return: Decorator
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not app.config['RATE_LIMITS_ENABLED']:
+                return f(*args, **kwargs)
+
+            rate, burst, concurrency = app.config['RATE_LIMITS'][endpoint_class]
+            key = 'ratelimit:%s:%s' % (request.args.get('API_KEY'), endpoint_class)
+            request_id = uuid.uuid4().hex
+
+            try:
+                result = admit(
+                    keys=['%s:bucket' % key, '%s:inflight' % key],
+                    args=[rate, burst, concurrency, time.time(), request_id, app.config['RATE_LIMIT_TIMEOUT_SECONDS']])
+            except RedisError:
+                return f(*args, **kwargs)
+
+            if not result[0]:
+                reason, retry_after = result[1], result[2]
+                requests_shed.inc(endpoint_class=endpoint_class, reason=reason)
+
+                return json_response(status=429, message="Too Many Requests",
+                                     headers={'Retry-After': str(int(math.ceil(float(retry_after))))})
+
+            try:
+                return f(*args, **kwargs)
+            finally:
+                try:
+                    redis.zrem('%s:inflight' % key, request_id)
+                except RedisError:
+                    # The slot expires on its own after RATE_LIMIT_TIMEOUT_SECONDS
+                    pass
+
+        return decorated
+    return decorator
@@ -1,10 +1,13 @@
 import json
+import time
 
 from flask import Response
 from bson import ObjectId
 
+from service.utils.metrics import add_phase
 
-def __convert_objects(obj):
+
+def convert_objects(obj):
     """
     Convert target objects into strings that JSON can serialize
 
@@ -21,13 +24,14 @@ def __convert_objects(obj):
     return obj
 
 
-def json_response(status=200, message=None, data=None):
+def json_response(status=200, message=None, data=None, headers=None):
     """
     Return a Response object for the view to return
 
     :param status: HTTP Status code
     :param message: A string indicating the reason for the response code
     :param data: Optional data object
+    :param headers: Optional dictionary of extra response headers
     :return: Response
     """
 
@@ -41,4 +45,21 @@ def json_response(status=200, message=None, data=None):
     if status >= 200 and status < 300:
         response['success'] = True
 
-    return Response(response=json.dumps(response, default=__convert_objects), status=status, content_type='application/json')
\ No newline at end of file
+    started = time.time()
+    body = json.dumps(response, default=convert_objects)
+    add_phase('json', time.time() - started)
+
+    return Response(response=body, status=status, headers=headers, content_type='application/json')
+
+
+def json_body_response(body, status=200, headers=None):
+    """
+    Return a Response object for a JSON body that has already been encoded, eg. one returned from a cache
+
+    :param body: JSON string
+    :param status: HTTP Status code
+    :param headers: Optional dictionary of extra response headers
+    :return: Response
+    """
+
+    return Response(response=body, status=status, headers=headers, content_type='application/json')